@@ -3,8 +3,21 @@ import os
 import google.generativeai as genai
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_community.vectorstores import FAISS
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_core.documents import Document
 from langchain_google_genai import GoogleGenerativeAIEmbeddings
-import re
+import faiss
+import numpy as np
+import pickle
+import shutil
+import atexit
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from tenacity import retry, stop_after_attempt, wait_exponential
+from embedding_cache import CachedEmbeddings
+from embedding_store import get_or_compute
+from semantic_cache import SemanticResponseCache
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -30,11 +43,32 @@ else:
     # Local development: load from .env file
     from dotenv import load_dotenv
     GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-VECTOR_DB_PATH = "gitlab_faiss_index"
+genai.configure(api_key=GEMINI_API_KEY)
+EMBEDDING_MODEL = "models/embedding-001"
+EMBEDDING_DIM = 768
+# Model and dimension are part of the path so an index is never loaded with the wrong embeddings
+VECTOR_DB_PATH = f"gitlab_faiss_index_{EMBEDDING_MODEL.split('/')[-1]}_{EMBEDDING_DIM}"
 TEXT_FILE_PATH = "gitlab_scraped.txt"
+EMBEDDING_STORE_PATH = "gitlab_emb_store.sqlite"
 CHUNK_SIZE = 1000
 CHUNK_OVERLAP = 200
-TOP_K_RESULTS = 10
+TOP_K_RESULTS = 5
+FETCH_K = 25  # candidates MMR picks the TOP_K_RESULTS most diverse chunks from
+MMR_LAMBDA = 0.5
+HISTORY_MESSAGES = 6  # most recent chat messages included in the prompt
+# Kept inside the index directory so a rebuilt index starts with an empty answer cache
+RESPONSE_CACHE_PATH = os.path.join(VECTOR_DB_PATH, "response_cache")
+INDEX_FILE_PATH = os.path.join(VECTOR_DB_PATH, "index.faiss")
+SEMANTIC_CACHE_THRESHOLD = 0.90  # query-to-query similarity, so stricter than retrieval
+EMBED_BATCH_SIZE = 100  # chunks per embedding request, the API's batch limit
+EMBED_CONCURRENCY = 16
+EMBED_MAX_ATTEMPTS = 5
+IVF_NLIST = 256
+IVF_NPROBE = 16
+PQ_M = 48  # 48 one-byte codes per 768-d vector
+PQ_NBITS = 8
+IVF_MIN_TRAIN = max(30 * IVF_NLIST, 39 * 2 ** PQ_NBITS)  # enough points to train both quantizers
+FORBIDDEN_WORDS = frozenset(["hack", "exploit", "bypass", "crack", "illegal", "porn", "nsfw", "weapon", "violence"])
 
 # Initialize session state
 if "messages" not in st.session_state:
@@ -55,56 +89,188 @@ def split_text_into_chunks(text_file_path):
     chunks = text_splitter.split_text(content)
     return chunks
 
-# Vector DB loader or creator
-def create_or_load_vector_db():
-    # Check if the vector database is already loaded
-    if "vector_db" in st.session_state:
-        vector_db = st.session_state.vector_db
-        st.success("Vector database loaded successfully!")
+# Embeddings client with a persistent query cache, shared across reruns
+@st.cache_resource
+def get_embeddings():
+    return CachedEmbeddings(model=EMBEDDING_MODEL, google_api_key=GEMINI_API_KEY)
+
+# Cache of past answers, looked up by query similarity and saved on shutdown
+@st.cache_resource
+def get_response_cache():
+    cache = SemanticResponseCache(EMBEDDING_DIM, SEMANTIC_CACHE_THRESHOLD, RESPONSE_CACHE_PATH)
+    atexit.register(cache.save)
+    return cache
+
+# One batched embedding request, retried with exponential backoff when rate-limited
+@retry(wait=wait_exponential(max=30), stop=stop_after_attempt(EMBED_MAX_ATTEMPTS), reraise=True)
+async def embed_batch(embeddings, batch):
+    return await embeddings.aembed_documents(batch, batch_size=EMBED_BATCH_SIZE)
+
+# Embed chunks in batches, with several batches in flight at once
+async def embed_all(chunks, embeddings, concurrency=EMBED_CONCURRENCY, on_progress=None):
+    semaphore = asyncio.Semaphore(concurrency)
+    completed = 0
+
+    async def embed_chunk_batch(batch):
+        nonlocal completed
+        async with semaphore:
+            vectors = await embed_batch(embeddings, batch)
+
+        completed += len(batch)
+        if on_progress:
+            on_progress(completed)
+        return vectors
+
+    batches = [chunks[i:i + EMBED_BATCH_SIZE] for i in range(0, len(chunks), EMBED_BATCH_SIZE)]
+    results = await asyncio.gather(*(embed_chunk_batch(batch) for batch in batches))
+    return [vector for batch_vectors in results for vector in batch_vectors]
+
+# Embed texts while showing a progress bar
+def embed_with_progress(texts):
+    # A fresh client per build: the async gRPC client binds to the first event loop that
+    # uses it, so reusing the cached one after a failed asyncio.run would keep failing
+    embeddings = GoogleGenerativeAIEmbeddings(model=EMBEDDING_MODEL, google_api_key=GEMINI_API_KEY)
+    progress = st.progress(0.0, text="Embedding chunks...")
+    vectors = asyncio.run(embed_all(
+        texts,
+        embeddings,
+        on_progress=lambda done: progress.progress(done / len(texts), text=f"Embedded {done}/{len(texts)} chunks")
+    ))
+    progress.empty()
+    return vectors
+
+# FAISS index over the chunk vectors: IVF-PQ once the corpus is large enough to train it,
+# otherwise an exhaustive scan over 8-bit scalar-quantized vectors (4x less memory than float32)
+def build_index(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    dim = vectors.shape[1]
+
+    if len(vectors) < IVF_MIN_TRAIN:
+        index = faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_L2)
     else:
-        if os.path.exists(VECTOR_DB_PATH):
-            with st.spinner("Loading vector database..."):
-                vector_db = FAISS.load_local(
-                    VECTOR_DB_PATH,
-                    GoogleGenerativeAIEmbeddings(model="models/embedding-001", google_api_key=GEMINI_API_KEY),
-                    allow_dangerous_deserialization=True
-                )
-                st.session_state.vector_db = vector_db  # Store the loaded vector db in session state
-                st.success("Vector database loaded successfully!")
-        else:
-            with st.spinner("Creating vector database from text file..."):
-                if not os.path.exists(TEXT_FILE_PATH):
-                    st.error(f"Text file not found: {TEXT_FILE_PATH}")
-                    return None
-
-                chunks = split_text_into_chunks(TEXT_FILE_PATH)
-                st.info(f"Split text into {len(chunks)} chunks")
-
-                embeddings = GoogleGenerativeAIEmbeddings(
-                    model="models/embedding-001",
-                    google_api_key=GEMINI_API_KEY
-                )
-                vector_db = FAISS.from_texts(chunks, embeddings)
-                vector_db.save_local(VECTOR_DB_PATH)
-                st.session_state.vector_db = vector_db  # Store the newly created vector db in session state
-                st.success("Vector database created successfully!")
+        quantizer = faiss.IndexFlatL2(dim)
+        index = faiss.IndexIVFPQ(quantizer, dim, IVF_NLIST, PQ_M, PQ_NBITS)
+        index.nprobe = IVF_NPROBE
+
+    index.train(vectors)
+    index.add(vectors)
+    if isinstance(index, faiss.IndexIVF):
+        index.make_direct_map()  # MMR reconstructs candidate vectors by id
+    return index
+
+# Vector DB creation from the scraped text
+def build_vector_db(embeddings):
+    with st.spinner("Creating vector database from text file..."):
+        chunks = split_text_into_chunks(TEXT_FILE_PATH)
+        st.info(f"Split text into {len(chunks)} chunks")
+
+        # Only chunks not embedded by a previous build hit the API
+        vectors = get_or_compute(
+            chunks,
+            EMBEDDING_MODEL,
+            embed_with_progress,
+            EMBEDDING_STORE_PATH
+        )
+        vector_db = FAISS(
+            embedding_function=embeddings,
+            index=build_index(vectors),
+            docstore=InMemoryDocstore({str(i): Document(page_content=chunk) for i, chunk in enumerate(chunks)}),
+            index_to_docstore_id={i: str(i) for i in range(len(chunks))}
+        )
+        vector_db.save_local(VECTOR_DB_PATH)
+        # Answers cached against a previous index no longer apply
+        shutil.rmtree(RESPONSE_CACHE_PATH, ignore_errors=True)
+
+# Held while building so concurrent sessions don't embed the corpus twice
+@st.cache_resource
+def get_build_lock():
+    return threading.Lock()
+
+# Memory-map an index file so its vectors are paged in on demand and shared between processes
+def read_index_mmap(path):
+    with open(path, 'rb') as f:
+        is_ivf = f.read(4).startswith(b'Iw')  # faiss tags every IVF index type "Iw.."
+    # IVF indexes map their inverted lists; flat-code indexes (SQ8, flat) map their code array
+    flags = (faiss.IO_FLAG_MMAP if is_ivf else faiss.IO_FLAG_MMAP_IFC) | faiss.IO_FLAG_READ_ONLY
+    try:
+        return faiss.read_index(path, flags)
+    except RuntimeError:
+        # Index types without mmap support are read into memory as before
+        return faiss.read_index(path)
+
+# Vector DB loader, shared by every session in the process.
+# No st elements inside: Streamlit replays them on every cache hit.
+@st.cache_resource(show_spinner="Loading vector database...")
+def load_vector_db():
+    index = read_index_mmap(INDEX_FILE_PATH)
+    with open(os.path.join(VECTOR_DB_PATH, "index.pkl"), "rb") as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+    vector_db = FAISS(
+        embedding_function=get_embeddings(),
+        index=index,
+        docstore=docstore,
+        index_to_docstore_id=index_to_docstore_id
+    )
+    if isinstance(vector_db.index, faiss.IndexIVF):
+        vector_db.index.nprobe = IVF_NPROBE  # overrides the nprobe saved with the index, so retuning needs no rebuild
+    return vector_db
 
+# Vector DB loader or creator
+def create_or_load_vector_db():
+    # Checked outside the cached loader so a missing file isn't cached as a result
+    if not os.path.exists(INDEX_FILE_PATH) and not os.path.exists(TEXT_FILE_PATH):
+        st.error(f"Text file not found: {TEXT_FILE_PATH}")
+        return None
+
+    if not os.path.exists(INDEX_FILE_PATH):
+        with get_build_lock():
+            # Another session may have finished the build while this one waited
+            if not os.path.exists(INDEX_FILE_PATH):
+                build_vector_db(get_embeddings())
+
+    vector_db = load_vector_db()
+    st.success("Vector database loaded successfully!")
     return vector_db
 
-# Main RAG function with guardrails and follow-up call
+# Guardrail: whole-word match of the query against the forbidden word list
+def is_forbidden(query):
+    # Split on every non-alphanumeric character, including Unicode punctuation like ’ — … ¿
+    tokens = "".join(ch if ch.isalnum() else " " for ch in query.lower()).split()
+    return not FORBIDDEN_WORDS.isdisjoint(tokens)
+
+# Context retrieval with MMR to skip near-duplicate chunks, cached per normalized query.
+# The embedding is derived from query_norm, so it is left out of the cache key along
+# with the vector DB (Streamlit skips hashing arguments with a leading underscore)
+@st.cache_data(ttl=3600, max_entries=256, show_spinner=False)
+def retrieve_context(_vector_db, query_norm, k, _query_embedding):
+    results = _vector_db.max_marginal_relevance_search_by_vector(
+        _query_embedding, k=k, fetch_k=FETCH_K, lambda_mult=MMR_LAMBDA
+    )
+    return "\n\n".join([doc.page_content for doc in results])
+
+# Main RAG function with guardrails and follow-up call, yielding the answer as it streams in
 def generate_response(query, vector_db, chat_history):
-    genai.configure(api_key=GEMINI_API_KEY)
+    if is_forbidden(query):
+        yield "⚠️ I'm not able to help with that request as it goes against ethical usage policies."
+        return
+
+    query_norm = query.strip().lower()
+    query_embedding = get_embeddings().embed_query(query_norm)
 
-    forbidden_patterns = ["hack", "exploit", "bypass", "crack", "illegal", "porn", "nsfw", "weapon", "violence"]
-    if any(re.search(rf"\b{pattern}\b", query.lower()) for pattern in forbidden_patterns):
-        return "⚠️ I'm not able to help with that request as it goes against ethical usage policies."
+    # Later turns can lean on the conversation ("can you elaborate?"), so only
+    # opening questions are answered from, or added to, the shared cache
+    use_response_cache = len(chat_history) <= 1
+    if use_response_cache:
+        cached_response = get_response_cache().lookup(query_embedding)
+        if cached_response is not None:
+            yield cached_response
+            return
 
-    results = vector_db.similarity_search(query, k=TOP_K_RESULTS)
-    context_text = "\n\n".join([doc.page_content for doc in results])
+    context_text = retrieve_context(vector_db, query_norm, TOP_K_RESULTS, query_embedding)
 
     history_text = ""
     if chat_history:
-        for msg in chat_history:
+        for msg in chat_history[-HISTORY_MESSAGES:]:
             role = "User" if msg["role"] == "user" else "Assistant"
             history_text += f"{role}: {msg['content']}\n"
 
@@ -126,14 +292,16 @@ Your response should be informative, accurate, and based only on the provided co
 """
 
     model = genai.GenerativeModel('gemini-2.0-flash')
-    response = model.generate_content(prompt)
+    response = ""
+    for chunk in model.generate_content(prompt, stream=True):
+        response += chunk.text
+        yield chunk.text
 
-    return response.text
+    if use_response_cache:
+        get_response_cache().add(query_embedding, query, response)
 
 # Suggest follow-up questions
 def suggest_follow_ups(query, vector_db):
-    genai.configure(api_key=GEMINI_API_KEY)
-
     followup_prompt = f"""
 Given the user's question: "{query}",
 suggest 2-3 relevant follow-up questions that could help them better understand GitLab concepts or related features.
@@ -149,9 +317,9 @@ Format:
     return followups.text
 
 # Display chat message
-def format_chat_message(message, is_user=False):
+def format_chat_message(message, is_user=False, container=st):
     if is_user:
-        st.markdown(
+        container.markdown(
             f"""
             <div class="user-message">
                 <div class="user-message-content">
@@ -162,7 +330,7 @@ def format_chat_message(message, is_user=False):
             unsafe_allow_html=True
         )
     else:
-        st.markdown(
+        container.markdown(
             f"""
             <div class="bot-message">
                 <div class="bot-message-content">
@@ -214,12 +382,21 @@ def main():
 
         with st.spinner("Thinking..."):
             try:
-                response = generate_response(user_query, vector_db, st.session_state.messages)
-                st.session_state.messages.append({"role": "assistant", "content": response})
-                format_chat_message(response)
+                # Follow-ups only depend on the query, so generate them while the answer streams
+                with ThreadPoolExecutor(max_workers=1) as executor:
+                    followups_future = executor.submit(suggest_follow_ups, user_query, vector_db)
+
+                    # Render the answer into a placeholder as it streams in
+                    placeholder = st.empty()
+                    response = ""
+                    for piece in generate_response(user_query, vector_db, st.session_state.messages):
+                        response += piece
+                        format_chat_message(response, container=placeholder)
+                    st.session_state.messages.append({"role": "assistant", "content": response})
+
+                    followups = followups_future.result()
 
                 # Suggested follow-ups
-                followups = suggest_follow_ups(user_query, vector_db)
                 with st.expander("💡 Suggested Follow-Up Questions"):
                     st.markdown(followups)
 
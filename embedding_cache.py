@@ -0,0 +1,57 @@
+import hashlib
+import shelve
+import threading
+from typing import List
+
+from langchain_google_genai import GoogleGenerativeAIEmbeddings
+
+# Shared by every instance: shelve does not support concurrent access and
+# Streamlit serves each session from its own thread.
+_cache_lock = threading.Lock()
+
+
+class CachedEmbeddings(GoogleGenerativeAIEmbeddings):
+    """Gemini embeddings backed by a persistent on-disk cache.
+
+    Vectors are stored in a shelve database keyed by
+    SHA-256(model + "\\0" + text), so repeated queries never hit the API twice.
+    """
+
+    cache_path: str = "gitlab_emb_cache.db"
+
+    def _cache_key(self, text, kind="query"):
+        # Gemini embeds queries and documents with different task types, so
+        # the two must not share cache entries.
+        prefix = self.model if kind == "query" else f"{self.model}\0{kind}"
+        return hashlib.sha256(f"{prefix}\0{text}".encode("utf-8")).hexdigest()
+
+    def embed_query(self, text: str, **kwargs) -> List[float]:
+        key = self._cache_key(text)
+        with _cache_lock, shelve.open(self.cache_path) as cache:
+            if key in cache:
+                return cache[key]
+
+        vector = super().embed_query(text, **kwargs)
+
+        with _cache_lock, shelve.open(self.cache_path) as cache:
+            cache[key] = vector
+        return vector
+
+    def embed_documents(self, texts: List[str], **kwargs) -> List[List[float]]:
+        keys = [self._cache_key(text, "document") for text in texts]
+        vectors = [None] * len(texts)
+
+        with _cache_lock, shelve.open(self.cache_path) as cache:
+            for i, key in enumerate(keys):
+                if key in cache:
+                    vectors[i] = cache[key]
+
+        misses = [i for i, vector in enumerate(vectors) if vector is None]
+        if misses:
+            computed = super().embed_documents([texts[i] for i in misses], **kwargs)
+            with _cache_lock, shelve.open(self.cache_path) as cache:
+                for i, vector in zip(misses, computed):
+                    cache[keys[i]] = vector
+                    vectors[i] = vector
+
+        return vectors
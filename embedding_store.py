@@ -0,0 +1,58 @@
+import hashlib
+import sqlite3
+
+import numpy as np
+
+# Stays under SQLite's default limit on bound parameters per statement
+_QUERY_BATCH = 500
+
+
+def _chunk_hash(model, chunk):
+    return hashlib.sha256(f"{model}\0{chunk}".encode("utf-8")).digest()
+
+
+def get_or_compute(chunks, model, compute, db_path="gitlab_emb_store.sqlite"):
+    """Return an embedding for every chunk, computing only the ones not stored yet.
+
+    Vectors are stored in SQLite keyed by SHA-256(model + "\\0" + chunk), so
+    re-indexing after a re-scrape only embeds chunks whose text changed.
+
+    Args:
+        chunks (list): Texts to embed
+        model (str): Embedding model name, part of the cache key
+        compute (callable): Embeds a list of texts, returning one vector per text
+        db_path (str): Path to the SQLite database
+
+    Returns:
+        list: One float32 numpy array per chunk, in input order
+    """
+    con = sqlite3.connect(db_path)
+    try:
+        con.execute('CREATE TABLE IF NOT EXISTS embeddings (hash BLOB PRIMARY KEY, vector BLOB)')
+
+        hashes = [_chunk_hash(model, chunk) for chunk in chunks]
+        stored = {}
+        unique_hashes = list(dict.fromkeys(hashes))
+        for i in range(0, len(unique_hashes), _QUERY_BATCH):
+            batch = unique_hashes[i:i + _QUERY_BATCH]
+            placeholders = ','.join('?' * len(batch))
+            stored.update(con.execute(
+                f'SELECT hash, vector FROM embeddings WHERE hash IN ({placeholders})', batch
+            ))
+
+        # First occurrence of each chunk that still needs embedding
+        missing = {}
+        for h, chunk in zip(hashes, chunks):
+            if h not in stored and h not in missing:
+                missing[h] = chunk
+
+        if missing:
+            vectors = compute(list(missing.values()))
+            rows = [(h, np.asarray(v, dtype=np.float32).tobytes()) for h, v in zip(missing, vectors)]
+            con.executemany('INSERT OR REPLACE INTO embeddings (hash, vector) VALUES (?, ?)', rows)
+            con.commit()
+            stored.update(rows)
+
+        return [np.frombuffer(stored[h], dtype=np.float32) for h in hashes]
+    finally:
+        con.close()
@@ -1,30 +1,70 @@
-import requests
+import argparse
+import asyncio
+import atexit
+import hashlib
+import io
+import json
+import sqlite3
+import aiohttp
 from bs4 import BeautifulSoup
-import time
+from pybloom_live import ScalableBloomFilter
 from urllib.parse import urljoin, urlparse
-from collections import deque
+from urllib.robotparser import RobotFileParser
+
+FLUSH_EVERY = 32  # pages written between explicit flushes of the output file
+MAX_RETRIES = 3
+BACKOFF_FACTOR = 0.5  # seconds; doubles on each retry
+RETRY_STATUSES = {429, 500, 502, 503, 504}
 
 class GitLabScraper:
-    def __init__(self, start_urls, output_file="gitlab_scraped.txt"):
+    def __init__(self, start_urls, output_file="gitlab_scraped.txt", concurrency=16,
+                 state_file="scraper_state.db", resume=False):
         """
         Initialize the GitLab scraper.
         
         Args:
             start_urls (list): List of URLs to start scraping from
             output_file (str): Path to the output text file
+            concurrency (int): Maximum number of requests in flight at once
+            state_file (str): SQLite database holding visited and queued URLs between runs
+            resume (bool): Continue the previous crawl instead of starting over
         """
         self.start_urls = start_urls
         self.output_file = output_file
-        self.visited_urls = set()
-        self.to_visit = deque(start_urls)
+        self.concurrency = concurrency
         self.domain_whitelist = [
             "handbook.gitlab.com/handbook",
             "about.gitlab.com/direction"
         ]
         
-        # Clear the output file
-        with open(self.output_file, 'w', encoding='utf-8') as f:
-            f.write("# GitLab Content Scrape\n\n")
+        # Visited and queued URLs are persisted so an interrupted crawl can resume
+        self._db = sqlite3.connect(state_file)
+        self._db.execute('CREATE TABLE IF NOT EXISTS visited (url TEXT PRIMARY KEY)')
+        self._db.execute('CREATE TABLE IF NOT EXISTS frontier (url TEXT PRIMARY KEY)')
+        # Kept across fresh crawls so unchanged pages can be revalidated instead of re-downloaded
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS page_cache ('
+            'url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, body_hash BLOB, content TEXT, links TEXT)'
+        )
+        if not resume:
+            self._db.execute('DELETE FROM visited')
+            self._db.execute('DELETE FROM frontier')
+            self._db.commit()
+        
+        # The bloom filter answers most "seen this URL?" checks without touching the database
+        self._bloom = ScalableBloomFilter(initial_capacity=10**6, error_rate=1e-4)
+        for (url,) in self._db.execute('SELECT url FROM visited'):
+            self._bloom.add(url)
+        self._in_flight = set()  # claimed by a worker but not yet written out
+        self._robots = {}  # host -> task resolving to its parsed robots.txt
+        self._disallowed = set()  # skipped because of robots.txt, so links to them are not queued again
+        resuming = len(self._bloom) > 0
+        
+        # Clear the output file (unless resuming) and keep it open for the whole crawl
+        self._fh = open(self.output_file, 'a' if resuming else 'w', encoding='utf-8', buffering=1 << 16)
+        if not resuming:
+            self._fh.write("# GitLab Content Scrape\n\n")
+        atexit.register(self.close)
         
         # Add headers to mimic a browser and avoid being blocked
         self.headers = {
@@ -52,35 +92,28 @@ class GitLabScraper:
     
     def extract_text(self, soup, url):
         """Extract text content from headings and paragraphs."""
-        content = []
+        content = io.StringIO()
         
         # Get the title of the page
         title = soup.title.string if soup.title else "Untitled Page"
-        content.append(f"\n\n## {title.strip()}\n")
-        content.append(f"URL: {url}\n")
-        
-        # Extract text from all headings (h1, h2, h3, etc.)
-        for heading_tag in ['h1', 'h2', 'h3', 'h4', 'h5', 'h6']:
-            for heading in soup.find_all(heading_tag):
-                text = heading.get_text().strip()
-                if text:
-                    prefix = '#' * (int(heading_tag[1]) + 2)  # Adjust heading level for markdown
-                    content.append(f"{prefix} {text}\n")
-        
-        # Extract paragraphs
-        for paragraph in soup.find_all('p'):
-            text = paragraph.get_text().strip()
-            if text:
-                content.append(f"{text}\n\n")
-        
-        # Extract list items
-        for ul in soup.find_all(['ul', 'ol']):
-            for li in ul.find_all('li'):
-                text = li.get_text().strip()
-                if text:
-                    content.append(f"- {text}\n")
-        
-        return "".join(content)
+        content.write(f"\n\n## {title.strip()}\n")
+        content.write(f"URL: {url}\n")
+        
+        # Extract headings, paragraphs and list items in one pass, in document order
+        for element in soup.find_all(['h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'p', 'li']):
+            text = element.get_text().strip()
+            if not text:
+                continue
+            
+            if element.name == 'p':
+                content.write(f"{text}\n\n")
+            elif element.name == 'li':
+                content.write(f"- {text}\n")
+            else:
+                prefix = '#' * (int(element.name[1]) + 2)  # Adjust heading level for markdown
+                content.write(f"{prefix} {text}\n")
+        
+        return content.getvalue()
     
     def extract_links(self, soup, base_url):
         """Extract links from the soup object."""
@@ -100,66 +133,242 @@ class GitLabScraper:
         
         return links
     
-    def scrape_url(self, url):
-        """Scrape a single URL and return its content."""
+    def is_visited(self, url):
+        """Check whether a URL is being scraped now, was scraped by any run, or is disallowed by robots.txt."""
+        if url in self._in_flight or url in self._disallowed:
+            return True
+        if url not in self._bloom:
+            return False
+        # Bloom filters can give false positives, so confirm against the database
+        return self._db.execute('SELECT 1 FROM visited WHERE url = ?', (url,)).fetchone() is not None
+    
+    def enqueue(self, url):
+        """Queue a URL for scraping and record it so a restart picks it up."""
+        self.to_visit.put_nowait(url)
+        self._db.execute('INSERT OR IGNORE INTO frontier (url) VALUES (?)', (url,))
+    
+    def checkpoint(self):
+        """Flush written pages to disk and commit the matching crawl state."""
+        self._fh.flush()
+        self._db.commit()
+    
+    async def load_robots(self, session, robots_url):
+        """Fetch and parse a host's robots.txt."""
+        parser = RobotFileParser(robots_url)
+        try:
+            async with session.get(robots_url, timeout=aiohttp.ClientTimeout(total=10)) as response:
+                if response.status in (401, 403):
+                    parser.disallow_all = True
+                elif response.status < 400:
+                    parser.parse((await response.text()).splitlines())
+                else:
+                    parser.allow_all = True
+        except Exception as e:
+            print(f"Could not fetch {robots_url}: {str(e)}")
+            parser.allow_all = True
+        return parser
+    
+    async def allowed_by_robots(self, session, url):
+        """Check a URL against its host's robots.txt, fetching that once per host."""
+        parsed = urlparse(url)
+        host = f"{parsed.scheme}://{parsed.netloc}"
+        if host not in self._robots:
+            self._robots[host] = asyncio.ensure_future(self.load_robots(session, f"{host}/robots.txt"))
+        parser = await self._robots[host]
+        return parser.can_fetch(self.headers['User-Agent'], url)
+    
+    def parse_page(self, body, url):
+        """Parse a page into its text content and the links it points to."""
+        # lxml is C-backed; given raw bytes it detects the encoding itself
+        soup = BeautifulSoup(body, 'lxml')
+        return self.extract_text(soup, url), self.extract_links(soup, url)
+    
+    async def fetch(self, session, url, headers=None):
+        """
+        Download a page, holding a concurrency slot for the duration.
+        
+        Connection errors, timeouts and 429/5XX responses are retried with exponential backoff.
+        
+        Returns:
+            tuple: Status code, body bytes (empty on 304) and response headers
+        """
+        for attempt in range(MAX_RETRIES + 1):
+            if attempt:
+                await asyncio.sleep(BACKOFF_FACTOR * 2 ** (attempt - 1))
+            
+            try:
+                async with self.semaphore:
+                    async with session.get(url, headers=headers, timeout=aiohttp.ClientTimeout(total=10)) as response:
+                        if response.status in RETRY_STATUSES and attempt < MAX_RETRIES:
+                            continue
+                        response.raise_for_status()  # Raise an exception for 4XX/5XX responses
+                        body = await response.read()
+                    
+                    # Rate limiting to be respectful
+                    await asyncio.sleep(0.1)
+                
+                return response.status, body, response.headers
+            
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                if attempt == MAX_RETRIES:
+                    raise
+    
+    async def scrape_url(self, session, url):
+        """Scrape a single URL and return its content, or None if it could not be fetched."""
         try:
             print(f"Scraping: {url}")
-            response = requests.get(url, headers=self.headers, timeout=10)
-            response.raise_for_status()  # Raise an exception for 4XX/5XX responses
             
-            soup = BeautifulSoup(response.text, 'html.parser')
-            text_content = self.extract_text(soup, url)
-            links = self.extract_links(soup, url)
+            # Revalidate pages seen by an earlier crawl instead of downloading them again
+            cached = self._db.execute(
+                'SELECT etag, last_modified, body_hash, content, links FROM page_cache WHERE url = ?', (url,)
+            ).fetchone()
+            headers = {}
+            if cached and cached[0]:
+                headers['If-None-Match'] = cached[0]
+            if cached and cached[1]:
+                headers['If-Modified-Since'] = cached[1]
+            
+            status, body, response_headers = await self.fetch(session, url, headers)
+            body_hash = hashlib.sha256(body).digest() if status != 304 else None
+            
+            if cached and (status == 304 or body_hash == cached[2]):
+                # Unchanged since the last crawl: reuse what was extracted then
+                text_content, links = cached[3], json.loads(cached[4])
+            else:
+                # Parse off the event loop so other fetches keep going
+                loop = asyncio.get_running_loop()
+                text_content, links = await loop.run_in_executor(None, self.parse_page, body, url)
+            
+            if status != 304:
+                self._db.execute(
+                    'INSERT OR REPLACE INTO page_cache (url, etag, last_modified, body_hash, content, links) '
+                    'VALUES (?, ?, ?, ?, ?, ?)',
+                    (url, response_headers.get('ETag'), response_headers.get('Last-Modified'),
+                     body_hash, text_content, json.dumps(links))
+                )
             
             # Add unvisited links to the queue
             for link in links:
-                if link not in self.visited_urls:
-                    self.to_visit.append(link)
-            
-            # Add the current URL to visited
-            self.visited_urls.add(url)
+                if not self.is_visited(link):
+                    self.enqueue(link)
             
             return text_content
             
         except Exception as e:
             print(f"Error scraping {url}: {str(e)}")
-            return f"\n\nError scraping {url}: {str(e)}\n\n"
+            return None
+    
+    async def worker(self, session):
+        """Scrape URLs from the queue until cancelled."""
+        while True:
+            url = await self.to_visit.get()
+            try:
+                # Skip if already visited or the page budget is spent
+                if self.is_visited(url) or self.page_count >= self.max_pages:
+                    continue
+                
+                self._in_flight.add(url)
+                if not await self.allowed_by_robots(session, url):
+                    print(f"Skipping {url}: disallowed by robots.txt")
+                    self._disallowed.add(url)
+                    self._in_flight.discard(url)
+                    self._db.execute('DELETE FROM frontier WHERE url = ?', (url,))
+                    continue
+                
+                self.page_count += 1
+                
+                content = await self.scrape_url(session, url)
+                if content is None:
+                    # Leave failed pages unvisited and queued so a resumed crawl retries them
+                    self._in_flight.discard(url)
+                else:
+                    await self.results.put((url, content))
+                
+                print(f"Progress: {self.page_count}/{self.max_pages} pages scraped. {self.to_visit.qsize()} pages in queue.")
+            finally:
+                self.to_visit.task_done()
+    
+    async def writer(self):
+        """Append scraped content to the output file, one page at a time."""
+        pages_written = 0
+        while True:
+            url, content = await self.results.get()
+            self._fh.write(content)
+            
+            # A page only counts as visited once its content is written
+            self._bloom.add(url)
+            self._db.execute('INSERT OR IGNORE INTO visited (url) VALUES (?)', (url,))
+            self._db.execute('DELETE FROM frontier WHERE url = ?', (url,))
+            self._in_flight.discard(url)
+            
+            pages_written += 1
+            if pages_written % FLUSH_EVERY == 0:
+                self.checkpoint()
+            self.results.task_done()
+    
+    async def crawl(self, max_pages):
+        """Crawl from the start URLs with a pool of concurrent workers."""
+        self.max_pages = max_pages
+        # max_pages covers the whole crawl, so a resumed run only scrapes what is left of it
+        self.page_count = self._db.execute('SELECT COUNT(*) FROM visited').fetchone()[0]
+        self.to_visit = asyncio.Queue()
+        self.results = asyncio.Queue()
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+        
+        # Pick up links queued by a previous run
+        pending = [url for (url,) in self._db.execute('SELECT url FROM frontier')]
+        for url in self.start_urls:
+            if not self.is_visited(url):
+                self.enqueue(url)
+        for url in pending:
+            self.to_visit.put_nowait(url)
+        
+        # One pooled session for the whole crawl, so TLS connections are reused across pages
+        connector = aiohttp.TCPConnector(
+            limit=self.concurrency,
+            limit_per_host=self.concurrency,
+            ttl_dns_cache=300,
+            keepalive_timeout=30
+        )
+        async with aiohttp.ClientSession(headers=self.headers, connector=connector) as session:
+            workers = [asyncio.create_task(self.worker(session)) for _ in range(self.concurrency)]
+            writer = asyncio.create_task(self.writer())
+            
+            # The queue drains once every discovered URL is scraped or skipped
+            await self.to_visit.join()
+            await self.results.join()
+            
+            for task in workers + [writer]:
+                task.cancel()
+            await asyncio.gather(*workers, writer, return_exceptions=True)
+        
+        self.checkpoint()
     
     def run(self, max_pages=500):
         """
         Run the scraper.
         
         Args:
-            max_pages (int): Maximum number of pages to scrape
+            max_pages (int): Maximum number of pages to scrape, counting pages from earlier runs when resuming
         """
-        page_count = 0
+        asyncio.run(self.crawl(max_pages))
         
-        while self.to_visit and page_count < max_pages:
-            # Get the next URL to visit
-            url = self.to_visit.popleft()
-            
-            # Skip if already visited
-            if url in self.visited_urls:
-                continue
-            
-            # Scrape the URL
-            content = self.scrape_url(url)
-            
-            # Save the content to the output file
-            with open(self.output_file, 'a', encoding='utf-8') as f:
-                f.write(content)
-            
-            page_count += 1
-            
-            # Rate limiting to be respectful
-            time.sleep(1)
-            
-            print(f"Progress: {page_count}/{max_pages} pages scraped. {len(self.to_visit)} pages in queue.")
-        
-        print(f"Scraping completed. {page_count} pages scraped.")
+        print(f"Scraping completed. {self.page_count} pages scraped.")
+    
+    def close(self):
+        """Save progress and close the output file and state database."""
+        if not self._fh.closed:
+            self.checkpoint()
+            self._fh.close()
+            self._db.close()
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scrape GitLab's Handbook and Direction pages.")
+    parser.add_argument("--resume", action="store_true",
+                        help="continue an interrupted crawl instead of starting a fresh one")
+    args = parser.parse_args()
+    
     # Starting URLs
     start_urls = [
         "https://handbook.gitlab.com/handbook",
@@ -167,7 +376,8 @@ if __name__ == "__main__":
     ]
     
     # Initialize and run the scraper
-    scraper = GitLabScraper(start_urls)
+    scraper = GitLabScraper(start_urls, resume=args.resume)
     scraper.run(max_pages=500)  # Adjust max_pages as needed
+    scraper.close()
     
     print(f"Content has been saved to {scraper.output_file}")
\ No newline at end of file
@@ -0,0 +1,63 @@
+import json
+import os
+import threading
+
+import faiss
+import numpy as np
+
+
+class SemanticResponseCache:
+    """Reuses generated answers for queries that paraphrase an earlier one.
+
+    Query embeddings are L2-normalized before going into an inner-product
+    index, so search scores are cosine similarities between queries.
+    """
+
+    def __init__(self, dim=768, threshold=0.90, path=None):
+        """
+        Args:
+            dim (int): Dimensionality of the query embeddings
+            threshold (float): Minimum cosine similarity for a cache hit
+            path (str): Directory to persist the cache in, or None to keep it in memory
+        """
+        self.threshold = threshold
+        self.path = path
+        self.index = faiss.IndexFlatIP(dim)
+        self.entries = []  # (query, response) pairs, parallel to the index rows
+        self._lock = threading.Lock()
+
+        if path and os.path.exists(os.path.join(path, "index.faiss")):
+            self.index = faiss.read_index(os.path.join(path, "index.faiss"))
+            with open(os.path.join(path, "entries.json"), 'r', encoding='utf-8') as f:
+                self.entries = [tuple(entry) for entry in json.load(f)]
+
+    @staticmethod
+    def _normalize(embedding):
+        vector = np.asarray(embedding, dtype=np.float32).reshape(1, -1)
+        faiss.normalize_L2(vector)
+        return vector
+
+    def lookup(self, embedding):
+        """Return the cached response for the closest past query, or None."""
+        with self._lock:
+            if self.index.ntotal == 0:
+                return None
+            scores, ids = self.index.search(self._normalize(embedding), 1)
+            if scores[0, 0] > self.threshold:
+                return self.entries[ids[0, 0]][1]
+        return None
+
+    def add(self, embedding, query, response):
+        with self._lock:
+            self.index.add(self._normalize(embedding))
+            self.entries.append((query, response))
+
+    def save(self):
+        """Write the index and its responses to ``path``."""
+        if not self.path:
+            return
+        with self._lock:
+            os.makedirs(self.path, exist_ok=True)
+            faiss.write_index(self.index, os.path.join(self.path, "index.faiss"))
+            with open(os.path.join(self.path, "entries.json"), 'w', encoding='utf-8') as f:
+                json.dump(self.entries, f)